@@ -1,5 +1,10 @@
-ZIP_CHANGES_NAME = "changes.zip"
-CHANGES_NAME = ".changes"
-CONCRETE_NAME = "concrete-history"
-EDITS_NAME = "edits-history"
-METADATA_NAME = "metadata.json"
+from sys import intern as _intern
+
+# Interned, so comparing them against interned path parts is an identity check.
+ZIP_CHANGES_NAME = _intern("changes.zip")
+CHANGES_NAME = _intern(".changes")
+CONCRETE_NAME = _intern("concrete-history")
+EDITS_NAME = _intern("edits-history")
+CONCRETE_PACKED_NAME = _intern("concrete.jsonl")
+EDITS_PACKED_NAME = _intern("edits.jsonl")
+METADATA_NAME = _intern("metadata.json")
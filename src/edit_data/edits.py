@@ -1,13 +1,8 @@
 from __future__ import annotations
-import zipfile
-import json
-import os
-from typing import Any, Optional
+from bisect import bisect_right
+from typing import Iterator, Optional
 from pathlib import Path
 from datetime import datetime
-from dataclasses import dataclass
-
-from pydantic import BaseModel
 
 from edit_data.common import *
 from edit_data.types import *
@@ -27,10 +22,64 @@ def get_last_new_concrete_checkpoint(
         case NewConcreteCheckpoint():
             return checkpoint
         case SameConcreteCheckpoint():
-            return get_last_new_concrete_checkpoint(checkpoint.prev)
+            return checkpoint.base_new
+
+
+class TextBuffer:
+    """
+    A mutable text buffer for replaying many edits against one base string.
+    Changes are spliced into a bytearray in place; the text is decoded once
+    by `flatten`. Offsets index str characters, so the text is held in a
+    fixed-width encoding: one byte per character while it is all ASCII, and
+    UTF-32 from the first non-ASCII character on. Lone surrogates are kept
+    as they are, as str slicing would.
+    """
+
+    def __init__(self, original: str):
+        if original.isascii():
+            self.width = 1
+            self.buffer = bytearray(original, "ascii")
+        else:
+            self.width = 4
+            self.buffer = bytearray(original, "utf-32-le", "surrogatepass")
+
+    def __widen(self) -> None:
+        self.buffer = bytearray(self.buffer.decode("ascii"), "utf-32-le")
+        self.width = 4
+
+    def splice(self, offset: int, length: int, text: str) -> None:
+        if self.width == 1:
+            if text.isascii():
+                if offset >= len(self.buffer):
+                    # Typing at the end of the file
+                    self.buffer += text.encode("ascii")
+                else:
+                    self.buffer[offset : offset + length] = text.encode("ascii")
+                return
+            self.__widen()
+        encoded = text.encode("utf-32-le", "surrogatepass")
+        if 4 * offset >= len(self.buffer):
+            self.buffer += encoded
+        else:
+            self.buffer[4 * offset : 4 * (offset + length)] = encoded
+
+    def apply_change(self, change: ContentChange) -> None:
+        self.splice(change.rangeOffset, change.rangeLength, change.text)
+
+    def apply_edit(self, edit: Edit) -> None:
+        for change in edit.changes:
+            self.apply_change(change)
+
+    def flatten(self) -> str:
+        if self.width == 1:
+            return self.buffer.decode("ascii")
+        return self.buffer.decode("utf-32-le", "surrogatepass")
 
 
 def apply_change(base: str, change: ContentChange) -> str:
+    if change.rangeOffset >= len(base):
+        # Typing at the end of the file
+        return base + change.text
     return (
         base[: change.rangeOffset]
         + change.text
@@ -38,50 +87,158 @@ def apply_change(base: str, change: ContentChange) -> str:
     )
 
 
+def changes_are_descending(base: str, changes: list[ContentChange]) -> bool:
+    """
+    VS Code reports the changes of one edit last-to-first without overlaps.
+    Then every change's offsets are also valid against the unedited base.
+    """
+    if changes and len(base) < changes[0].rangeOffset + changes[0].rangeLength:
+        return False
+    return all(
+        later.rangeOffset + later.rangeLength <= earlier.rangeOffset
+        for earlier, later in zip(changes, changes[1:])
+    )
+
+
 def apply_edit(base: str, edit: Edit) -> str:
-    curbase = base
-    for change in edit.changes:
-        curbase = apply_change(curbase, change)
-    return curbase
+    if len(edit.changes) == 1:
+        return apply_change(base, edit.changes[0])
+
+    if not changes_are_descending(base, edit.changes):
+        curbase = base
+        for change in edit.changes:
+            curbase = apply_change(curbase, change)
+        return curbase
+
+    # Stitch the untouched spans and the new texts together in one join
+    parts: list[str] = []
+    pos = 0
+    for change in reversed(edit.changes):
+        parts.append(base[pos : change.rangeOffset])
+        parts.append(change.text)
+        pos = change.rangeOffset + change.rangeLength
+    parts.append(base[pos:])
+    return "".join(parts)
 
 
 def get_file_contents(base: str, edits: list[Edit]) -> str:
-    cur_base = base
+    buffer = TextBuffer(base)
     for edit in edits:
-        cur_base = apply_edit(cur_base, edit)
-    return cur_base
+        buffer.apply_edit(edit)
+    return buffer.flatten()
+
+
+# Snapshots already bound the replay of a lookup, so only the latest
+# versions are kept: enough for files unchanged since the last query.
+VERSION_CACHE_SIZE = 2
+SNAPSHOT_STRIDE = 64
+MAX_SNAPSHOTS = 32
+
+
+def get_snapshot_stride(file_history: FileChangeHistory) -> int:
+    """
+    SNAPSHOT_STRIDE, widened on long histories so that no more than
+    MAX_SNAPSHOTS copies of the file are kept.
+    """
+    num_edits = len(file_history.edits_history)
+    return max(SNAPSHOT_STRIDE, -(-num_edits // MAX_SNAPSHOTS))
+
+
+def get_snapshots(
+    file_history: FileChangeHistory, stride: Optional[int] = None
+) -> list[str]:
+    """
+    snapshots[k] holds the contents of the file right after edit k * stride.
+    Built with a single pass over the edit history.
+    """
+    if stride is None:
+        stride = get_snapshot_stride(file_history)
+    cache = file_history.snapshot_cache
+    if stride in cache:
+        return cache[stride]
+
+    snapshots: list[str] = []
+    buffer = TextBuffer("")
+    for i, edit in enumerate(file_history.edits_history):
+        if file_history.chain_starts[i] == i:
+            buffer = TextBuffer(
+                get_last_new_concrete_checkpoint(edit.base_change).contents
+            )
+        buffer.apply_edit(edit)
+        if i % stride == 0:
+            snapshots.append(buffer.flatten())
+
+    cache[stride] = snapshots
+    return snapshots
+
+
+def get_version_at_index(file_history: FileChangeHistory, edit_idx: int) -> str:
+    """
+    Contents of the file right after `edit_idx` is applied.
+    Replays at most one snapshot stride of edits from the nearest snapshot.
+    """
+    cache = file_history.version_cache
+    if edit_idx in cache:
+        return cache[edit_idx]
+
+    chain_start = file_history.chain_starts[edit_idx]
+    stride = get_snapshot_stride(file_history)
+    snapshot_idx = (edit_idx // stride) * stride
+    if chain_start <= snapshot_idx:
+        base = get_snapshots(file_history, stride)[edit_idx // stride]
+        replay_start = snapshot_idx + 1
+    else:
+        last_edit = file_history.edits_history[edit_idx]
+        base = get_last_new_concrete_checkpoint(last_edit.base_change).contents
+        replay_start = chain_start
+
+    contents = get_file_contents(
+        base, file_history.edits_history[replay_start : edit_idx + 1]
+    )
+
+    if VERSION_CACHE_SIZE <= len(cache):
+        del cache[next(iter(cache))]
+    cache[edit_idx] = contents
+    return contents
+
+
+def iter_versions(
+    file_history: FileChangeHistory, stop: Optional[int] = None
+) -> Iterator[str]:
+    """
+    Contents of the file right after each edit, in order, up to but not
+    including edit `stop`. Each edit is applied once to the previous version,
+    starting over from the base checkpoint whenever the base changes.
+    """
+    edits = file_history.edits_history
+    chain_starts = file_history.chain_starts
+    contents = ""
+    for i in range(len(edits) if stop is None else stop):
+        edit = edits[i]
+        if chain_starts[i] == i:
+            contents = get_last_new_concrete_checkpoint(edit.base_change).contents
+        contents = apply_edit(contents, edit)
+        yield contents
 
 
 def get_version_at_time(
     file: Path, workspace_history: dict[Path, FileChangeHistory], time: datetime
 ) -> str:
     assert file in workspace_history, f"Have no history for {file}."
-    file_history = workspace_history[file]
+    return _get_version_at_milis(workspace_history[file], datetime_to_milis(time))
 
-    # Find the edit that is closest to the time
-    edit_sequence: list[Edit] = []
-    for edit in file_history.edits_history:
-        if edit.time > time:
-            break
-        edit_sequence.append(edit)
 
-    if 0 == len(edit_sequence):
+def _get_version_at_milis(file_history: FileChangeHistory, milis: int) -> str:
+    edit_times = file_history.edit_times
+    if not edit_times or milis < edit_times[0]:
         return get_last_new_concrete_checkpoint(file_history.last_checkpoint).contents
 
-    # Get the chain of edits and checkpoint up to the last edit
-    last_edit = edit_sequence[-1]
-    reversed_edits = edit_sequence[::-1]
-    last_edit_chain: list[Edit] = []
-    for edit in reversed_edits:
-        if edit.base_change != last_edit.base_change:
-            break
-        last_edit_chain.append(edit)
-    last_edit_chain.reverse()
-
-    return get_file_contents(
-        get_last_new_concrete_checkpoint(last_edit.base_change).contents,
-        last_edit_chain,
-    )
+    if milis >= edit_times[-1]:
+        edit_idx = len(edit_times) - 1
+    else:
+        # Find the last edit at or before the time
+        edit_idx = bisect_right(edit_times, milis) - 1
+    return get_version_at_index(file_history, edit_idx)
 
 
 def get_version_at_edit(
@@ -94,10 +251,21 @@ def get_version_at_edit(
     ), f"Edit index {edit_idx} out of range."
 
     target_edit = file_history.edits_history[edit_idx]
-    versions: dict[Path, str] = {}
-    for f in workspace_history:
-        versions[f] = get_version_at_time(f, workspace_history, target_edit.time)
-    return versions
+    return get_all_versions_at_time(workspace_history, target_edit.time)
+
+
+def get_all_versions_at_time(
+    workspace_history: dict[Path, FileChangeHistory], time: datetime
+) -> dict[Path, str]:
+    """
+    Contents of every file in the workspace at `time`.
+    Repeated queries are served from each file's version cache.
+    """
+    milis = datetime_to_milis(time)
+    return {
+        f: _get_version_at_milis(file_history, milis)
+        for f, file_history in workspace_history.items()
+    }
 
 
 def total_num_edits(workspace_history: dict[Path, FileChangeHistory]) -> int:
@@ -4,6 +4,7 @@ For testing purposes.
 
 import os
 import socket
+from operator import attrgetter
 from pathlib import Path
 from datetime import datetime, timedelta
 
@@ -23,24 +24,26 @@ def get_linear_file_history(
     file: Path, contents: str, start_time: datetime, delta_milis: int
 ) -> FileChangeHistory:
     concrete_orig = NewConcreteCheckpoint(contents="", mtime=start_time)
+    file_name = str(file)
+    delta = timedelta(milliseconds=delta_milis)
     edits_history: list[Edit] = []
     cur_time = start_time
     cur_line = 0
     cur_col = 0
+    # The end of one character's range is the start of the next one on the
+    # same line, so each Position is built once and shared.
+    cur_start = Position(line=cur_line, character=cur_col)
     for i, ch in enumerate(contents):
-        cur_time = cur_time + timedelta(milliseconds=delta_milis)
-        ch_range = Range(
-            start=Position(line=cur_line, character=cur_col),
-            end=Position(line=cur_line, character=cur_col + 1),
-        )
+        cur_time = cur_time + delta
+        cur_end = Position(line=cur_line, character=cur_col + 1)
         edit = Edit(
-            file=str(file),
+            file=file_name,
             time=cur_time,
             base_change=concrete_orig,
             changes=[
                 # A simple change that appends one character at the end
                 ContentChange(
-                    range=ch_range,
+                    range=Range(start=cur_start, end=cur_end),
                     text=ch,
                     rangeOffset=i,
                     rangeLength=1,
@@ -50,8 +53,10 @@ def get_linear_file_history(
         if ch == "\n":
             cur_line += 1
             cur_col = 0
+            cur_start = Position(line=cur_line, character=cur_col)
         else:
             cur_col += 1
+            cur_start = cur_end
         edits_history.append(edit)
     return FileChangeHistory(
         path=file,
@@ -76,5 +81,5 @@ def get_linear_workspace_history(root: Path) -> WorkspaceChangeHistory:
             workspace_history[file_history.path] = file_history
     metadata = get_local_state()
 
-    sorted_files = sorted(list(workspace_history.values()), key=lambda fh: fh.path)
+    sorted_files = sorted(workspace_history.values(), key=attrgetter("path"))
     return WorkspaceChangeHistory(metadata=metadata, files=sorted_files)
@@ -1,19 +1,68 @@
-from typing import Any, Optional, Literal
-
-import os
-import re
+from typing import (
+    Annotated,
+    Any,
+    Iterable,
+    Iterator,
+    Optional,
+    Literal,
+    TypeVar,
+    Union,
+    cast,
+)
+
+import sys
 import json
+import difflib
+from array import array
 import zipfile
-import tempfile
 from datetime import datetime
 from pathlib import Path
 from dataclasses import dataclass
-
-from pydantic import BaseModel, model_validator
+from functools import cached_property, lru_cache
+from itertools import accumulate
+
+from pydantic import (
+    AfterValidator,
+    BaseModel,
+    BeforeValidator,
+    Discriminator,
+    Tag,
+    TypeAdapter,
+    ValidationError,
+    model_validator,
+)
+from pydantic_core import from_json, to_json
 
 from edit_data.common import *
 
 
+_T = TypeVar("_T")
+
+
+def loads_ts_json(data: str | bytes) -> Any:
+    """
+    pydantic-core's parser rejects lone surrogate escapes such as "\\ud83d",
+    which JSON.stringify can write; those documents go through json.loads.
+    """
+    try:
+        return from_json(data)
+    except ValueError:
+        return json.loads(data)
+
+
+def validate_ts_json(adapter: TypeAdapter[_T], data: str | bytes) -> _T:
+    """
+    Parse and validate in a single pass, falling back to `loads_ts_json`
+    for documents pydantic-core cannot parse.
+    """
+    try:
+        return adapter.validate_json(data)
+    except ValidationError as e:
+        if not any(error["type"] == "json_invalid" for error in e.errors()):
+            raise
+        return adapter.validate_python(json.loads(data))
+
+
 def datetime_from_milis(ms: int) -> datetime:
     return datetime.fromtimestamp(ms / 1000)
 
@@ -22,7 +71,8 @@ def datetime_to_milis(dt: datetime) -> int:
     return int(dt.timestamp() * 1000)
 
 
-class Position(BaseModel):
+@dataclass(frozen=True, slots=True)
+class Position:
     line: int
     character: int
 
@@ -41,7 +91,8 @@ class Position(BaseModel):
         )
 
 
-class Range(BaseModel):
+@dataclass(frozen=True, slots=True)
+class Range:
     start: Position
     end: Position
 
@@ -61,12 +112,38 @@ class Range(BaseModel):
 
     @classmethod
     def from_response(cls, data: Any) -> "Range":
-        return cls(
-            start=Position.from_response(data["start"]),
-            end=Position.from_response(data["end"]),
+        return get_range(
+            data["start"]["line"],
+            data["start"]["character"],
+            data["end"]["line"],
+            data["end"]["character"],
         )
 
 
+@lru_cache(maxsize=65536)
+def get_range(
+    start_line: int, start_character: int, end_line: int, end_character: int
+) -> Range:
+    """
+    Ranges are immutable and keystroke edits repeat the same few, so they are shared.
+    """
+    return Range(
+        start=Position(line=start_line, character=start_character),
+        end=Position(line=end_line, character=end_character),
+    )
+
+
+def _shared_range(value: Any) -> Any:
+    if isinstance(value, dict):
+        return Range.from_response(value)
+    return value
+
+
+def _intern_short_text(text: str) -> str:
+    # Most changes are single keystrokes; share one object per distinct text.
+    return sys.intern(text) if len(text) <= 2 else text
+
+
 class NewConcreteCheckpoint(BaseModel):
     contents: str
     mtime: datetime
@@ -89,6 +166,18 @@ class SameConcreteCheckpoint(BaseModel):
     prev: "ConcreteCheckpoint"
     mtime: datetime
 
+    @cached_property
+    def base_new(self) -> NewConcreteCheckpoint:
+        # Resolved once per checkpoint, stopping at the first link of the
+        # chain that already resolved it. Not a field, so it plays no part
+        # in equality or serialization.
+        prev = self.prev
+        while isinstance(prev, SameConcreteCheckpoint):
+            if "base_new" in prev.__dict__:
+                return prev.base_new
+            prev = prev.prev
+        return prev
+
     def to_ts_dict(self) -> dict[str, Any]:
         return {
             "type": "same",
@@ -99,10 +188,45 @@ class SameConcreteCheckpoint(BaseModel):
 
 ConcreteCheckpoint = NewConcreteCheckpoint | SameConcreteCheckpoint
 
-
-class ContentChange(BaseModel):
-    range: Range
-    text: str
+# Only checkpoints larger than this are worth diffing against their predecessor.
+DELTA_MIN_SIZE = 4096
+
+ContentsDelta = list[tuple[int, int, str]]
+
+
+def diff_contents(old: str, new: str) -> ContentsDelta:
+    """
+    Line-level (offset, length, text) replacements that turn old into new.
+    Offsets index into old and are ascending.
+    """
+    old_lines = old.splitlines(keepends=True)
+    new_lines = new.splitlines(keepends=True)
+    old_starts = list(accumulate(map(len, old_lines), initial=0))
+    matcher = difflib.SequenceMatcher(None, old_lines, new_lines)
+    delta: ContentsDelta = []
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            continue
+        offset = old_starts[i1]
+        delta.append((offset, old_starts[i2] - offset, "".join(new_lines[j1:j2])))
+    return delta
+
+
+def patch_contents(old: str, delta: ContentsDelta) -> str:
+    parts: list[str] = []
+    pos = 0
+    for offset, length, text in delta:
+        parts.append(old[pos:offset])
+        parts.append(text)
+        pos = offset + length
+    parts.append(old[pos:])
+    return "".join(parts)
+
+
+@dataclass(frozen=True, slots=True)
+class ContentChange:
+    range: Annotated[Range, BeforeValidator(_shared_range)]
+    text: Annotated[str, AfterValidator(_intern_short_text)]
     rangeOffset: int
     rangeLength: int
 
@@ -124,6 +248,10 @@ class ContentChange(BaseModel):
         )
 
 
+# Validates all changes of an edit in one call rather than one model at a time.
+_CHANGES_ADAPTER = TypeAdapter(list[ContentChange])
+
+
 class Edit(BaseModel):
     file: str
     time: datetime
@@ -139,20 +267,39 @@ class Edit(BaseModel):
         }
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class RawEdit:
+    """
+    An edit as decoded from disk. `time` stays in milliseconds since the
+    epoch; it is only turned into a datetime once the edit is built.
+    """
+
     file: str
-    time: datetime
+    time: int
     changes: list[ContentChange]
 
+    @property
+    def time_dt(self) -> datetime:
+        return datetime_from_milis(self.time)
+
     @classmethod
     def from_ts_dict(cls, obj: Any):
         return cls(
             obj["file"],
-            datetime_from_milis(int(obj["time"])),
-            [ContentChange.from_ts_dict(c) for c in obj["changes"]],
+            int(obj["time"]),
+            _CHANGES_ADAPTER.validate_python(obj["changes"]),
         )
 
+    @classmethod
+    def from_ts_json(cls, data: str | bytes) -> "RawEdit":
+        """
+        Parse and validate an edit file in a single pass.
+        """
+        return validate_ts_json(_RAW_EDIT_ADAPTER, data)
+
+
+_RAW_EDIT_ADAPTER = TypeAdapter(RawEdit)
+
 
 @dataclass(frozen=True)
 class FileChangeHistory:
@@ -160,52 +307,211 @@ class FileChangeHistory:
     edits_history: list[Edit]
     last_checkpoint: ConcreteCheckpoint
 
-    def __gather_concrete_checkpoints(self) -> dict[datetime, ConcreteCheckpoint]:
-        concrete_checkpoints: dict[datetime, ConcreteCheckpoint] = {}
+    @cached_property
+    def edit_times(self) -> "array[int]":
+        """
+        Edit times in milliseconds since the epoch, the resolution the
+        extension records them at. Packed as int64, one machine word per
+        edit, and searched with bisect.
+        """
+        return array("q", (datetime_to_milis(edit.time) for edit in self.edits_history))
+
+    @cached_property
+    def chain_starts(self) -> list[int]:
+        """
+        chain_starts[i] is the index of the first edit in the run of
+        consecutive edits sharing the base checkpoint of edit i.
+        """
+        starts: list[int] = []
+        prev_base: Optional[ConcreteCheckpoint] = None
+        for i, edit in enumerate(self.edits_history):
+            base = edit.base_change
+            # Loaded edits share checkpoint objects, so identity settles
+            # almost every comparison before falling back to model equality.
+            if 0 < i and (base is prev_base or base == prev_base):
+                starts.append(starts[-1])
+            else:
+                starts.append(i)
+            prev_base = base
+        return starts
+
+    @cached_property
+    def version_cache(self) -> dict[int, str]:
+        """
+        Reconstructed contents keyed by edit index. Filled by `edits.get_version_at_index`.
+        Holds at most `edits.VERSION_CACHE_SIZE` full copies of the file.
+        """
+        return {}
+
+    @cached_property
+    def snapshot_cache(self) -> dict[int, list[str]]:
+        """
+        Contents after every `stride`-th edit, keyed by stride. Filled by `edits.get_snapshots`.
+        Holds at most `edits.MAX_SNAPSHOTS` full copies of the file per stride.
+        """
+        return {}
+
+    def clear_caches(self) -> None:
+        """
+        Release the reconstructed versions and snapshots of this file.
+        They are rebuilt on the next lookup.
+        """
+        self.__dict__.pop("version_cache", None)
+        self.__dict__.pop("snapshot_cache", None)
+
+    def __gather_concrete_checkpoints(self) -> dict[int, ConcreteCheckpoint]:
+        concrete_checkpoints: dict[int, ConcreteCheckpoint] = {}
         for edit in self.edits_history:
-            if edit.base_change.mtime not in concrete_checkpoints:
-                concrete_checkpoints[edit.base_change.mtime] = edit.base_change
+            mtime_milis = datetime_to_milis(edit.base_change.mtime)
+            if mtime_milis not in concrete_checkpoints:
+                concrete_checkpoints[mtime_milis] = edit.base_change
         return concrete_checkpoints
 
-    def write_concrete_checkpoints(self, changes_path: Path) -> None:
-        checkpoint_path = changes_path / self.path / CONCRETE_NAME
+    def __checkpoint_ts_dicts(self, delta: bool) -> dict[int, dict[str, Any]]:
         concrete_checkpoints = self.__gather_concrete_checkpoints()
+        if not delta:
+            return {
+                mtime_milis: checkpoint.to_ts_dict()
+                for mtime_milis, checkpoint in concrete_checkpoints.items()
+            }
+
+        # Large new checkpoints are stored as a diff against the previous one
+        ts_dicts: dict[int, dict[str, Any]] = {}
+        prev_new: Optional[NewConcreteCheckpoint] = None
+        for mtime_milis, checkpoint in sorted(concrete_checkpoints.items()):
+            ts_dicts[mtime_milis] = checkpoint.to_ts_dict()
+            if not isinstance(checkpoint, NewConcreteCheckpoint):
+                continue
+            if prev_new is not None and DELTA_MIN_SIZE < len(checkpoint.contents):
+                contents_delta = diff_contents(prev_new.contents, checkpoint.contents)
+                delta_size = sum(len(text) for _, _, text in contents_delta)
+                if delta_size < len(checkpoint.contents) // 2:
+                    ts_dicts[mtime_milis] = RawDeltaConcreteCheckpoint(
+                        datetime_to_milis(prev_new.mtime), mtime_milis, contents_delta
+                    ).to_ts_dict()
+            prev_new = checkpoint
+        return ts_dicts
+
+    def concrete_checkpoint_entries(
+        self, packed: bool = False, delta: bool = False
+    ) -> Iterator[tuple[Path, bytes]]:
+        """
+        Checkpoint files as (path relative to the changes root, contents).
+        """
+        checkpoint_path = self.path / CONCRETE_NAME
+        checkpoint_dicts = self.__checkpoint_ts_dicts(delta)
+        if packed:
+            yield checkpoint_path / CONCRETE_PACKED_NAME, b"".join(
+                to_json(checkpoint_dict) + b"\n"
+                for checkpoint_dict in checkpoint_dicts.values()
+            )
+            return
+
+        for mtime_milis, checkpoint_dict in checkpoint_dicts.items():
+            yield checkpoint_path / f"{mtime_milis}", to_json(checkpoint_dict, indent=2)
+
+    def edit_entries(self, packed: bool = False) -> Iterator[tuple[Path, bytes]]:
+        """
+        Edit files as (path relative to the changes root, contents).
+        """
+        edits_path = self.path / EDITS_NAME
+        if packed:
+            yield edits_path / EDITS_PACKED_NAME, b"".join(
+                to_json(edit.to_ts_dict()) + b"\n" for edit in self.edits_history
+            )
+            return
 
-        checkpoint_path.mkdir(parents=True, exist_ok=True)
-        for mtime, checkpoint in concrete_checkpoints.items():
-            mtime_milis = datetime_to_milis(mtime)
-            checkpoint_file = checkpoint_path / f"{mtime_milis}"
-            with open(checkpoint_file, "w", encoding="utf-8") as f:
-                json.dump(checkpoint.to_ts_dict(), f, indent=2)
-
-    def write_edits(self, changes_path: Path) -> None:
-        edits_path = changes_path / self.path / EDITS_NAME
-        edits_path.mkdir(parents=True, exist_ok=True)
         for edit in self.edits_history:
             mtime_milis = datetime_to_milis(edit.time)
-            edit_file = edits_path / f"{mtime_milis}"
-            with open(edit_file, "w", encoding="utf-8") as f:
-                json.dump(edit.to_ts_dict(), f, indent=2)
+            yield edits_path / f"{mtime_milis}", to_json(edit.to_ts_dict(), indent=2)
+
+    def ts_entries(
+        self, packed: bool = False, delta: bool = False
+    ) -> Iterator[tuple[Path, bytes]]:
+        """
+        Every file that `write_ts_file_history` writes, without touching disk.
+        """
+        yield from self.concrete_checkpoint_entries(packed, delta)
+        yield from self.edit_entries(packed)
+
+    def write_concrete_checkpoints(
+        self, changes_path: Path, packed: bool = False, delta: bool = False
+    ) -> None:
+        (changes_path / self.path / CONCRETE_NAME).mkdir(parents=True, exist_ok=True)
+        write_entries(changes_path, self.concrete_checkpoint_entries(packed, delta))
+
+    def write_edits(self, changes_path: Path, packed: bool = False) -> None:
+        (changes_path / self.path / EDITS_NAME).mkdir(parents=True, exist_ok=True)
+        write_entries(changes_path, self.edit_entries(packed))
+
+    def write_ts_file_history(
+        self, changes_path: Path, packed: bool = False, delta: bool = False
+    ) -> None:
+        """
+        With `packed`, all checkpoints and all edits of the file are written
+        as one JSON Lines file each instead of one file per timestamp.
+        With `delta`, large new checkpoints are written as a diff against
+        the previous new checkpoint when that is substantially smaller.
+        """
+        self.write_concrete_checkpoints(changes_path, packed, delta)
+        self.write_edits(changes_path, packed)
+
+
+def write_entries(changes_path: Path, entries: Iterable[tuple[Path, bytes]]) -> None:
+    """
+    Write (relative path, contents) entries under changes_path.
+    Parent directories must already exist.
+    """
+    for entry_path, contents in entries:
+        with open(changes_path / entry_path, "wb") as f:
+            f.write(contents)
+
+
+@dataclass(frozen=True, slots=True)
+class RawSameConcreteCheckpoint:
+    """
+    Times are in milliseconds since the epoch, as in RawEdit.
+    """
 
-    def write_ts_file_history(self, changes_path: Path) -> None:
-        self.write_concrete_checkpoints(changes_path)
-        self.write_edits(changes_path)
+    prevMtime: int
+    mtime: int
 
+    @classmethod
+    def from_ts_dict(cls, obj: Any):
+        return cls(int(obj["prevMtime"]), int(obj["mtime"]))
 
-@dataclass(frozen=True)
-class RawSameConcreteCheckpoint:
-    prevMtime: datetime
-    mtime: datetime
+
+@dataclass(frozen=True, slots=True)
+class RawDeltaConcreteCheckpoint:
+    """
+    A new checkpoint stored as a diff against the new checkpoint at prevMtime.
+    Times are in milliseconds since the epoch, as in RawEdit.
+    """
+
+    prevMtime: int
+    mtime: int
+    delta: ContentsDelta
+
+    def to_ts_dict(self) -> dict[str, Any]:
+        return {
+            "type": "delta",
+            "prevMtime": self.prevMtime,
+            "mtime": self.mtime,
+            "delta": [list(d) for d in self.delta],
+        }
 
     @classmethod
     def from_ts_dict(cls, obj: Any):
         return cls(
-            datetime_from_milis(int(obj["prevMtime"])),
-            datetime_from_milis(int(obj["mtime"])),
+            int(obj["prevMtime"]),
+            int(obj["mtime"]),
+            [(int(offset), int(length), text) for offset, length, text in obj["delta"]],
         )
 
 
-RawConcreteCheckpoint = NewConcreteCheckpoint | RawSameConcreteCheckpoint
+RawConcreteCheckpoint = (
+    NewConcreteCheckpoint | RawSameConcreteCheckpoint | RawDeltaConcreteCheckpoint
+)
 
 
 def raw_concrete_checkpoint_from_json(json_data: Any) -> RawConcreteCheckpoint:
@@ -215,10 +521,49 @@ def raw_concrete_checkpoint_from_json(json_data: Any) -> RawConcreteCheckpoint:
             return RawSameConcreteCheckpoint.from_ts_dict(json_data)
         case "new":
             return NewConcreteCheckpoint.from_ts_dict(json_data)
+        case "delta":
+            return RawDeltaConcreteCheckpoint.from_ts_dict(json_data)
         case _:
             raise ValueError(f"Unknown checkpoint type {attempted_type}")
 
 
+def _checkpoint_type(obj: Any) -> Optional[str]:
+    if not isinstance(obj, dict):
+        return None
+    return cast(dict[str, Any], obj).get("type")
+
+
+def _new_checkpoint_from_ts(value: Any) -> Any:
+    # The extension writes mtime in milliseconds since the epoch, which the
+    # model's own datetime field would read differently.
+    if isinstance(value, dict):
+        return NewConcreteCheckpoint.from_ts_dict(value)
+    return value
+
+
+_RAW_CHECKPOINT_ADAPTER: TypeAdapter[RawConcreteCheckpoint] = TypeAdapter(
+    Annotated[
+        Union[
+            Annotated[
+                NewConcreteCheckpoint,
+                BeforeValidator(_new_checkpoint_from_ts),
+                Tag("new"),
+            ],
+            Annotated[RawSameConcreteCheckpoint, Tag("same")],
+            Annotated[RawDeltaConcreteCheckpoint, Tag("delta")],
+        ],
+        Discriminator(_checkpoint_type),
+    ]
+)
+
+
+def raw_concrete_checkpoint_from_ts_json(data: str | bytes) -> RawConcreteCheckpoint:
+    """
+    Parse and validate a checkpoint file in a single pass, dispatching on its type.
+    """
+    return validate_ts_json(_RAW_CHECKPOINT_ADAPTER, data)
+
+
 class LocalChangeMetadata(BaseModel):
     type: Literal["local"] = "local"
     hostname: str
@@ -315,12 +660,15 @@ def metadata_from_ts_dict(obj: Any) -> ChangeMetadata:
             raise ValueError(f"Unknown metadata type {attempted_type}")
 
 
+def ts_metadata_contents(metadata: ChangeMetadata) -> bytes:
+    return to_json(metadata.to_ts_dict(), indent=2)
+
+
 def write_ts_metadata(metadata: ChangeMetadata, changes_path: Path) -> None:
-    metadata_file = changes_path / "metadata.json"
+    metadata_file = changes_path / METADATA_NAME
     changes_path.mkdir(parents=True, exist_ok=True)
-    with open(metadata_file, "w", encoding="utf-8") as f:
-        metadata_dict = metadata.to_ts_dict()
-        f.write(json.dumps(metadata_dict, indent=2))
+    with open(metadata_file, "wb") as f:
+        f.write(ts_metadata_contents(metadata))
 
 
 class WorkspaceChangeHistory(BaseModel):
@@ -338,18 +686,27 @@ class WorkspaceChangeHistory(BaseModel):
     def get_dict(self) -> dict[Path, FileChangeHistory]:
         return {f.path: f for f in self.files}
 
-    def write_ts_workspace_history(self, changes_path: Path) -> None:
-        with tempfile.TemporaryDirectory() as tmp_dir:
-            tmp_dir_path = Path(tmp_dir)
-            write_ts_metadata(self.metadata, tmp_dir_path)
+    def write_ts_workspace_history(
+        self,
+        changes_path: Path,
+        packed: bool = False,
+        delta: bool = False,
+        compression: int = zipfile.ZIP_STORED,
+        compresslevel: Optional[int] = None,
+    ) -> None:
+        """
+        Entries are stored uncompressed by default, which is the fastest to
+        write and read back. For archives that leave the machine, pass
+        compression=zipfile.ZIP_DEFLATED; compresslevel=1 costs little time
+        over storing and still shrinks the JSON a lot.
+        """
+        # Entries are serialized straight into the archive.
+        with zipfile.ZipFile(
+            changes_path, "w", compression=compression, compresslevel=compresslevel
+        ) as zipped_file:
+            zipped_file.writestr(METADATA_NAME, ts_metadata_contents(self.metadata))
             for f in self.files:
-                f.write_ts_file_history(tmp_dir_path)
-
-            with zipfile.ZipFile(changes_path, "w") as zipped_file:
-                for folder_path, _, filenames in os.walk(tmp_dir_path):
-                    for filename in filenames:
-                        file_path = Path(folder_path) / filename
-                        arc_name = file_path.relative_to(tmp_dir_path)
-                        zipped_file.write(file_path, arc_name)
+                for entry_path, contents in f.ts_entries(packed, delta):
+                    zipped_file.writestr(entry_path.as_posix(), contents)
 
-            assert changes_path.exists(), f"Failed to create {changes_path}"
+        assert changes_path.exists(), f"Failed to create {changes_path}"
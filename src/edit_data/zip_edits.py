@@ -2,43 +2,57 @@
 Does the things from `edits.py` but in memory with a Zipfile
 """
 
-from typing import Optional
-
+from typing import (
+    Any,
+    Callable,
+    Iterable,
+    Iterator,
+    Mapping,
+    Optional,
+    Sequence,
+    TypeVar,
+)
+
+import io
 import os
-import tempfile
+import re
+import sys
 import zipfile
-
-import json
-from pydantic import TypeAdapter
+from itertools import islice
+from operator import attrgetter, le
 
 from pathlib import Path
 from datetime import datetime
 from dataclasses import dataclass
+from functools import partial
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
 
 from edit_data.types import *
 from edit_data.common import *
 
 
-@dataclass
+@dataclass(slots=True)
 class FileNode:
     part: str
     children: dict[str, "FileTree"]
 
+    def __repr__(self) -> str:
+        # The generated repr would format the whole subtree.
+        return f"FileNode({self.part!r}, <{len(self.children)} children>)"
+
     def iterdir(self) -> list[str]:
         return list(self.children.keys())
 
     def find(self, path: Path) -> "FileTree | None":
-        if len(path.parts) == 0:
-            return self
-        first_part = path.parts[0]
-        if first_part in self.children:
-            child = self.children[first_part]
-            if isinstance(child, FileNode):
-                return child.find(Path(*path.parts[1:]))
-            else:
+        # One dict lookup per part, without building a Path for each level.
+        node = self
+        for part in path.parts:
+            child = node.children.get(part)
+            if not isinstance(child, FileNode):
+                # Missing (None) or a file, which ends the walk.
                 return child
-        else:
-            return None
+            node = child
+        return node
 
     def get_dir(self, path: Path) -> "FileNode":
         node = self.find(path)
@@ -47,19 +61,22 @@ class FileNode:
         return node  # type: ignore
 
     def put(self, path: Path, full_path: Path):
-        if len(path.parts) == 0:
+        parts = path.parts
+        if len(parts) == 0:
             return
-        first_part = path.parts[0]
-        if first_part not in self.children:
-            if len(path.parts) == 1:
-                self.children[first_part] = full_path
+        # Walk down one level per part without building intermediate Paths.
+        # Parts are interned, so directory names repeated across the tree
+        # share one string and match dict keys by identity.
+        node = self
+        for part in parts[:-1]:
+            part = sys.intern(part)
+            child = node.children.get(part)
+            if child is None:
+                child = node.children[part] = FileNode(part, {})
+            elif not isinstance(child, FileNode):
                 return
-            else:
-                assert len(path.parts) > 1
-                self.children[first_part] = FileNode(first_part, {})
-        child = self.children[first_part]
-        if isinstance(child, FileNode):
-            child.put(Path(*path.parts[1:]), full_path)
+            node = child
+        node.children.setdefault(sys.intern(parts[-1]), full_path)
 
 
 FileTree = FileNode | Path
@@ -77,15 +94,17 @@ def build_file_tree(paths: list[Path]) -> FileNode:
 
 
 def is_important_path(path: Path) -> bool:
-    if path == Path(METADATA_NAME):
+    parts = path.parts
+    if parts == (METADATA_NAME,):
         return True
-    if len(path.parts) < 3:
+    if len(parts) < 3:
         return False
-    if path.parts[-2] != EDITS_NAME and path.parts[-2] != CONCRETE_NAME:
-        return False
-    if not is_num(path.parts[-1]):
-        return False
-    return True
+    kind, name = parts[-2], parts[-1]
+    if kind == EDITS_NAME:
+        return name == EDITS_PACKED_NAME or (name.isascii() and name.isdigit())
+    if kind == CONCRETE_NAME:
+        return name == CONCRETE_PACKED_NAME or (name.isascii() and name.isdigit())
+    return False
 
 
 def get_file_real_path(important_path: Path) -> Optional[Path]:
@@ -100,167 +119,559 @@ def get_file_real_path(important_path: Path) -> Optional[Path]:
 
 
 def get_real_paths(important_paths: list[Path]) -> set[Path]:
-    real_paths: set[Path] = set()
-    for p in important_paths:
-        real_path = get_file_real_path(p)
-        if real_path is not None:
-            real_paths.add(real_path)
-    return real_paths
+    assert all(map(is_important_path, important_paths))
+    # Every important path but metadata.json sits two levels below its file.
+    return {p.parent.parent for p in important_paths if p.parts != (METADATA_NAME,)}
+
 
+# Matches the archive names that is_important_path accepts. Directory
+# entries end in "/" and never match.
+_IMPORTANT_RE = re.compile(
+    rf"{re.escape(METADATA_NAME)}"
+    rf"|.+/(?:{re.escape(EDITS_NAME)}/(?:[0-9]+|{re.escape(EDITS_PACKED_NAME)})"
+    rf"|{re.escape(CONCRETE_NAME)}/(?:[0-9]+|{re.escape(CONCRETE_PACKED_NAME)}))"
+)
 
-def load_zipfile_contents_from_file(f: zipfile.ZipFile) -> dict[Path, str]:
-    file_contents: dict[Path, str] = {}
+
+def iter_zip_entries(f: zipfile.ZipFile) -> Iterator[tuple[str, bytes]]:
+    """
+    Yields the important entries of the zip one at a time, so callers can
+    decode them as they come instead of holding the whole archive first.
+    Entries are keyed by their "/"-separated archive name.
+    """
     for info in f.infolist():
-        if info.is_dir():
+        if _IMPORTANT_RE.fullmatch(info.filename) is None:
             continue
-        if not is_important_path(Path(info.filename)):
-            continue
-        with f.open(info.filename) as file:
-            content = file.read().decode("utf-8")
-            file_contents[Path(info.filename)] = content
-    return file_contents
+        # Reading by ZipInfo skips the name lookup. The contents are kept
+        # as bytes; the JSON decoders read UTF-8 directly.
+        yield info.filename, f.read(info)
+
+
+def _read_zip_members(
+    zip_path: Path, infos: list[zipfile.ZipInfo]
+) -> list[tuple[str, bytes]]:
+    # Each worker reads through its own handle, since a ZipFile shares one
+    # file position between readers.
+    with zipfile.ZipFile(zip_path, "r") as f:
+        return [(info.filename, f.read(info)) for info in infos]
+
+
+def iter_zip_entries_threaded(
+    zip_path: Path, max_workers: int
+) -> Iterator[tuple[str, bytes]]:
+    """
+    Like `iter_zip_entries`, but the entries are read by a pool of threads,
+    each working through a contiguous share of the archive. zlib releases
+    the GIL while inflating, so this helps with deflated archives on
+    multi-core machines.
+    """
+    with zipfile.ZipFile(zip_path, "r") as f:
+        infos = [
+            info for info in f.infolist() if _IMPORTANT_RE.fullmatch(info.filename)
+        ]
+    chunk_size = max(1, -(-len(infos) // max_workers))
+    chunks = [infos[i : i + chunk_size] for i in range(0, len(infos), chunk_size)]
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        for entries in pool.map(partial(_read_zip_members, zip_path), chunks):
+            yield from entries
+
+
+def load_zipfile_contents_from_file(f: zipfile.ZipFile) -> dict[str, bytes]:
+    return dict(iter_zip_entries(f))
+
+
+IN_MEMORY_ZIP_LIMIT = 1 << 30
+
+
+def open_zip(zip_path: Path) -> zipfile.ZipFile:
+    """
+    Open a zip for reading. Archives under IN_MEMORY_ZIP_LIMIT bytes are
+    read with a single read and parsed from memory rather than seeking
+    around the file for the directory and every member.
+    """
+    if zip_path.stat().st_size < IN_MEMORY_ZIP_LIMIT:
+        return zipfile.ZipFile(io.BytesIO(zip_path.read_bytes()), "r")
+    return zipfile.ZipFile(zip_path, "r")
 
 
-def load_zipfile_contents_from_path(zip_path: Path) -> dict[Path, str]:
+def load_zipfile_contents_from_path(zip_path: Path) -> dict[str, bytes]:
     """
     Load a zipfile from the given path
     """
     if not zip_path.exists():
         raise FileNotFoundError(f"Zip file path {zip_path} does not exist")
-    with zipfile.ZipFile(zip_path, "r") as zipped_file:
+    with open_zip(zip_path) as zipped_file:
         return load_zipfile_contents_from_file(zipped_file)
 
 
+class ZipStore(Mapping[str, bytes]):
+    """
+    The important entries of a zip as a read-only mapping from archive name
+    to contents. Entries are only read and decompressed when looked up.
+    """
+
+    def __init__(self, zip_path: Path):
+        if not zip_path.exists():
+            raise FileNotFoundError(f"Zip file path {zip_path} does not exist")
+        self.__zip = zipfile.ZipFile(zip_path, "r")
+        self.__infos = {
+            info.filename: info
+            for info in self.__zip.infolist()
+            if _IMPORTANT_RE.fullmatch(info.filename)
+        }
+
+    def __getitem__(self, name: str) -> bytes:
+        return self.__zip.read(self.__infos[name])
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.__infos)
+
+    def __len__(self) -> int:
+        return len(self.__infos)
+
+    def close(self) -> None:
+        self.__zip.close()
+
+    def __enter__(self) -> "ZipStore":
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.close()
+
+
 def is_num(s: str) -> bool:
-    try:
-        int(s)
-        return True
-    except ValueError:
-        return False
+    # isdigit alone also accepts digits like "²" that int() rejects.
+    return s.isascii() and s.isdigit()
 
 
-def is_sorted(xs: list[float]) -> bool:
-    return all(xs[i] <= xs[i + 1] for i in range(len(xs) - 1))
+def is_sorted(xs: Sequence[float]) -> bool:
+    return all(map(le, xs, islice(xs, 1, None)))
 
 
 def raw_edits_to_edits(
     raw_edits: list[RawEdit],
     concrete_checkpoints: list[ConcreteCheckpoint],
+    checkpoint_times: Optional[list[int]] = None,
 ) -> list[Edit]:
     """
     Produces a list of edits.
     Raw edits are sorted by time.
     Concrete checkpoints are sorted by mtime.
+    Pass `checkpoint_times`, the checkpoint mtimes in milliseconds, if they
+    are already at hand.
     """
-    assert is_sorted([e.time.timestamp() for e in raw_edits])
-    assert is_sorted([c.mtime.timestamp() for c in concrete_checkpoints])
-
+    if checkpoint_times is None:
+        checkpoint_times = [datetime_to_milis(c.mtime) for c in concrete_checkpoints]
+    assert is_sorted([e.time for e in raw_edits])
+    assert is_sorted(checkpoint_times)
+
+    # Both lists are sorted, so a single forward scan pairs every edit with
+    # the last checkpoint at or before it. The base only changes when the
+    # scan moves, so it is looked up there rather than per edit.
+    num_checkpoints = len(checkpoint_times)
     checkpoint_ptr = 0
+    next_checkpoint_time = checkpoint_times[0] if num_checkpoints else None
+    base_change: Optional[ConcreteCheckpoint] = None
 
+    # Edits are built in the order of raw_edits, so they come out sorted.
     edits: list[Edit] = []
+    append = edits.append
     for raw_edit in raw_edits:
-        while checkpoint_ptr < len(concrete_checkpoints):
-            checkpoint = concrete_checkpoints[checkpoint_ptr]
-            if raw_edit.time < checkpoint.mtime:
-                break
-            checkpoint_ptr += 1
-        assert checkpoint_ptr > 0  # We always get a concrete checkpoint before the edit
-        base_change = concrete_checkpoints[checkpoint_ptr - 1]
-        assert base_change.mtime <= raw_edit.time
-        edit = Edit(
-            file=raw_edit.file,
-            time=raw_edit.time,
-            base_change=base_change,
-            changes=raw_edit.changes,
+        time = raw_edit.time
+        if next_checkpoint_time is not None and next_checkpoint_time <= time:
+            while checkpoint_ptr < num_checkpoints:
+                if time < checkpoint_times[checkpoint_ptr]:
+                    break
+                checkpoint_ptr += 1
+            base_change = concrete_checkpoints[checkpoint_ptr - 1]
+            next_checkpoint_time = (
+                checkpoint_times[checkpoint_ptr]
+                if checkpoint_ptr < num_checkpoints
+                else None
+            )
+        # We always get a concrete checkpoint before the edit
+        assert base_change is not None
+        append(
+            Edit(
+                file=raw_edit.file,
+                time=datetime_from_milis(time),
+                base_change=base_change,
+                changes=raw_edit.changes,
+            )
         )
-        edits.append(edit)
 
-    assert is_sorted([e.time.timestamp() for e in edits])
     return edits
 
 
+LOAD_CHUNKSIZE = 32
+
+# Sort keys evaluated in C rather than through a lambda per element.
+_TIME = attrgetter("time")
+_PATH = attrgetter("path")
+
+T = TypeVar("T")
+
+
+def _load_raw_checkpoint(contents: bytes) -> RawConcreteCheckpoint:
+    return raw_concrete_checkpoint_from_ts_json(contents)
+
+
+def _load_raw_edit(contents: bytes) -> RawEdit:
+    return RawEdit.from_ts_json(contents)
+
+
+def _raw_checkpoint_milis(raw_checkpoint: RawConcreteCheckpoint) -> int:
+    if isinstance(raw_checkpoint, NewConcreteCheckpoint):
+        return datetime_to_milis(raw_checkpoint.mtime)
+    return raw_checkpoint.mtime
+
+
+@dataclass(slots=True)
+class FileDocuments:
+    """
+    JSON documents of the concrete checkpoints and the edits of one file.
+    """
+
+    concrete: list[bytes]
+    edits: list[bytes]
+
+
+def add_history_entry(
+    documents: dict[str, FileDocuments],
+    entry_name: str,
+    contents: bytes,
+    until_milis: Optional[int] = None,
+) -> None:
+    """
+    Files the documents of a history entry under the file it belongs to.
+    A packed entry holds one document per line; every other entry holds a
+    single document and is named by its time in milliseconds, so edits
+    after `until_milis` are dropped without decoding them.
+    """
+    file, kind, name = entry_name.rsplit("/", 2)
+    file_documents = documents.get(file)
+    if file_documents is None:
+        file_documents = documents[file] = FileDocuments([], [])
+    if kind == CONCRETE_NAME:
+        target = file_documents.concrete
+        packed_name = CONCRETE_PACKED_NAME
+        until_milis = None
+    else:
+        target = file_documents.edits
+        packed_name = EDITS_PACKED_NAME
+    if name == packed_name:
+        target.extend(line for line in contents.split(b"\n") if line)
+    elif until_milis is None or int(name) <= until_milis:
+        target.append(contents)
+
+
+def _map_entries(
+    load: Callable[[bytes], T],
+    contents: Iterable[bytes],
+    executor: Optional[Executor],
+) -> list[T]:
+    if executor is None:
+        return list(map(load, contents))
+    return list(executor.map(load, contents, chunksize=LOAD_CHUNKSIZE))
+
+
 def load_file_history(
-    file: Path, file_dict: dict[Path, str], file_tree: FileNode
+    file: Path,
+    documents: FileDocuments,
+    executor: Optional[Executor] = None,
+    until: Optional[datetime] = None,
 ) -> FileChangeHistory:
-    file_node = file_tree.get_dir(file)
-    concrete_node = file_node.get_dir(Path(CONCRETE_NAME))
-    checkpoint_paths = concrete_node.children.values()
-
-    raw_checkpoints: list[RawConcreteCheckpoint] = []
-    for f in checkpoint_paths:
-        assert isinstance(f, Path)
-        data = json.loads(file_dict[f])
-        intermediate_checkpoint = raw_concrete_checkpoint_from_json(data)
-        raw_checkpoints.append(intermediate_checkpoint)
-    raw_checkpoints.sort(key=lambda x: x.mtime)
+    """
+    If an executor is given, the checkpoint and edit documents of the file
+    are decoded on it.
+    If `until` is given, only edits up to that time are loaded. Versions
+    at or before `until` are the same as with the full history.
+    """
+    if not documents.concrete:
+        raise FileNotFoundError(f"No concrete checkpoints found for {file}")
+    raw_checkpoints = _map_entries(_load_raw_checkpoint, documents.concrete, executor)
+    raw_checkpoints.sort(key=_raw_checkpoint_milis)
+    # Every checkpoint's mtime in milliseconds, converted once and reused
+    # as the lookup key and when pairing edits with their checkpoints.
+    checkpoint_times = list(map(_raw_checkpoint_milis, raw_checkpoints))
 
     # Establish pointers in memory
     concrete_checkpoints: list[ConcreteCheckpoint] = []
+    checkpoints_by_mtime: dict[int, ConcreteCheckpoint] = {}
     last_checkpoint: Optional[ConcreteCheckpoint] = None
-    for raw_checkpoint in raw_checkpoints:
+    for checkpoint_time, raw_checkpoint in zip(checkpoint_times, raw_checkpoints):
         match raw_checkpoint:
             case NewConcreteCheckpoint():
                 concrete_checkpoints.append(raw_checkpoint)
+                checkpoints_by_mtime[checkpoint_time] = raw_checkpoint
                 last_checkpoint = raw_checkpoint
             case RawSameConcreteCheckpoint(prevMtime, mtime):
-                assert prevMtime in concrete_checkpoints
+                # Checkpoints are sorted, so prev is already resolved along
+                # with the new checkpoint it points back to.
+                assert prevMtime in checkpoints_by_mtime
                 same_checkpoint = SameConcreteCheckpoint(
-                    prev=concrete_checkpoints[prevMtime], mtime=mtime
+                    prev=checkpoints_by_mtime[prevMtime],
+                    mtime=datetime_from_milis(mtime),
                 )
                 last_checkpoint = same_checkpoint
                 concrete_checkpoints.append(same_checkpoint)
+                checkpoints_by_mtime[mtime] = same_checkpoint
+            case RawDeltaConcreteCheckpoint(prevMtime, mtime, delta):
+                assert prevMtime in checkpoints_by_mtime
+                prev = checkpoints_by_mtime[prevMtime]
+                # Deltas are only ever written against a new checkpoint.
+                assert isinstance(prev, NewConcreteCheckpoint)
+                new_checkpoint = NewConcreteCheckpoint(
+                    contents=patch_contents(prev.contents, delta),
+                    mtime=datetime_from_milis(mtime),
+                )
+                concrete_checkpoints.append(new_checkpoint)
+                checkpoints_by_mtime[mtime] = new_checkpoint
+                last_checkpoint = new_checkpoint
 
     assert last_checkpoint is not None
 
-    # Sort checkpoints by time
-    concrete_checkpoints.sort(key=lambda x: x.mtime)
+    # concrete_checkpoints follows raw_checkpoints, so it is sorted by time.
 
     # Load Edits
-    if EDITS_NAME not in file_node.children:
-        return FileChangeHistory(file, [], last_checkpoint)
-    edits_node = file_node.get_dir(Path(EDITS_NAME))
-
-    raw_edits: list[RawEdit] = []
-    for f in edits_node.children.values():
-        assert isinstance(f, Path)
-        data = json.loads(file_dict[f])
-        raw_edit = RawEdit.from_ts_dict(data)
-        raw_edits.append(raw_edit)
+    raw_edits = _map_entries(_load_raw_edit, documents.edits, executor)
+    if until is not None:
+        until_milis = datetime_to_milis(until)
+        raw_edits = [e for e in raw_edits if e.time <= until_milis]
 
     # Sort edits by time
-    raw_edits.sort(key=lambda x: x.time)
+    raw_edits.sort(key=_TIME)
 
-    edits = raw_edits_to_edits(raw_edits, concrete_checkpoints)
+    edits = raw_edits_to_edits(raw_edits, concrete_checkpoints, checkpoint_times)
     return FileChangeHistory(file, edits, last_checkpoint)
 
 
-def get_metadata(file_tree: FileNode, file_dict: dict[Path, str]) -> ChangeMetadata:
-    if METADATA_NAME not in file_tree.children:
+class LazyFileChangeHistory(FileChangeHistory):
+    """
+    A file history that holds on to the JSON documents of its file and only
+    decodes them the first time its edits or last checkpoint are used.
+    """
+
+    documents: FileDocuments
+    until: Optional[datetime]
+
+    def __init__(
+        self, path: Path, documents: FileDocuments, until: Optional[datetime] = None
+    ):
+        object.__setattr__(self, "path", path)
+        object.__setattr__(self, "documents", documents)
+        object.__setattr__(self, "until", until)
+
+    def __getattr__(self, name: str) -> Any:
+        # Only reached while the loaded fields are still unset.
+        if name not in ("edits_history", "last_checkpoint"):
+            raise AttributeError(name)
+        loaded = load_file_history(self.path, self.documents, until=self.until)
+        object.__setattr__(self, "edits_history", loaded.edits_history)
+        object.__setattr__(self, "last_checkpoint", loaded.last_checkpoint)
+        # The decoded history replaces the raw documents.
+        object.__setattr__(self, "documents", FileDocuments([], []))
+        return getattr(loaded, name)
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, FileChangeHistory):
+            return NotImplemented
+        return (self.path, self.edits_history, self.last_checkpoint) == (
+            other.path,
+            other.edits_history,
+            other.last_checkpoint,
+        )
+
+
+def get_metadata(file_dict: Mapping[str, bytes]) -> ChangeMetadata:
+    metadata_contents = file_dict.get(METADATA_NAME)
+    if metadata_contents is None:
         raise FileNotFoundError("Metadata file not found in zip contents")
 
-    metadata_contents = file_dict[Path(METADATA_NAME)]
-    metadata = metadata_from_ts_dict(json.loads(metadata_contents))
+    metadata = metadata_from_ts_dict(loads_ts_json(metadata_contents))
     return metadata
 
 
-def load_workspace_history_from_zip_contents(
-    zip_contents: dict[Path, str],
+PARALLEL_CHUNKSIZE = 16
+
+
+def _load_file_histories_parallel(
+    documents: dict[str, FileDocuments], until: Optional[datetime]
+) -> list[FileChangeHistory]:
+    with ProcessPoolExecutor(max_workers=os.cpu_count()) as pool:
+        return list(
+            pool.map(
+                load_file_history,
+                map(Path, documents.keys()),
+                documents.values(),
+                [None] * len(documents),
+                [until] * len(documents),
+                chunksize=PARALLEL_CHUNKSIZE,
+            )
+        )
+
+
+def _load_file_histories(
+    file_documents: Iterable[tuple[str, FileDocuments]],
+    executor: Optional[Executor],
+    until: Optional[datetime],
+    parallel: bool,
+    lazy: bool,
+) -> list[FileChangeHistory]:
+    """
+    Files are taken one at a time, so each file's documents can be dropped
+    as soon as it is built. Only `parallel` holds all of them at once.
+    """
+    if lazy:
+        return [
+            LazyFileChangeHistory(Path(file_path), documents, until)
+            for file_path, documents in file_documents
+        ]
+    if parallel:
+        return _load_file_histories_parallel(dict(file_documents), until)
+    return [
+        load_file_history(Path(file_path), documents, executor, until)
+        for file_path, documents in file_documents
+    ]
+
+
+def _workspace_history(
+    metadata: ChangeMetadata, file_histories: list[FileChangeHistory]
+) -> WorkspaceChangeHistory:
+    sorted_files = sorted(file_histories, key=_PATH)
+    # Trusted: metadata and every file history were just validated, and the
+    # files are sorted right here, so files_must_be_sorted can be skipped.
+    return WorkspaceChangeHistory.model_construct(metadata=metadata, files=sorted_files)
+
+
+def _pop_file_documents(
+    documents: dict[str, FileDocuments],
+) -> Iterator[tuple[str, FileDocuments]]:
+    while documents:
+        yield documents.popitem()
+
+
+def load_workspace_history_from_entries(
+    entries: Iterable[tuple[str, bytes]],
+    executor: Optional[Executor] = None,
+    until: Optional[datetime] = None,
+    parallel: bool = False,
+    lazy: bool = False,
 ) -> WorkspaceChangeHistory:
-    file_tree_paths = get_real_paths(list(zip_contents.keys()))
-    file_tree = build_file_tree(list(zip_contents.keys()))
-    file_history_dict: dict[Path, FileChangeHistory] = {}
-    for file_path in file_tree_paths:
-        file_history = load_file_history(file_path, zip_contents, file_tree)
-        file_history_dict[file_path] = file_history
-    metadata = get_metadata(file_tree, zip_contents)
-    sorted_files = sorted(file_history_dict.values(), key=lambda fh: fh.path)
-    workspace_history = WorkspaceChangeHistory(metadata=metadata, files=sorted_files)
-    return workspace_history
+    """
+    Entries are filed under their file as they arrive, so they can be
+    streamed straight out of the zip.
+    With `parallel`, files are loaded in a pool of worker processes, one
+    file per task. This pays off for workspaces with more than a hundred
+    or so files. `executor` is not used in that case.
+    With `lazy`, each file is only decoded once its history is first used,
+    without `executor`, which may be shut down by then.
+    """
+    until_milis = None if until is None else datetime_to_milis(until)
+    metadata_entries: dict[str, bytes] = {}
+    # Archive names stay plain strings; only file paths become Paths.
+    documents: dict[str, FileDocuments] = {}
+    for entry_name, contents in entries:
+        if entry_name == METADATA_NAME:
+            metadata_entries[entry_name] = contents
+        else:
+            add_history_entry(documents, entry_name, contents, until_milis)
+    metadata = get_metadata(metadata_entries)
+    file_histories = _load_file_histories(
+        _pop_file_documents(documents), executor, until, parallel, lazy
+    )
+    return _workspace_history(metadata, file_histories)
+
+
+def group_history_entry_names(
+    entry_names: Iterable[str], until_milis: Optional[int] = None
+) -> dict[str, list[str]]:
+    """
+    Archive names of the history entries, grouped by the file they belong
+    to. Edit entries named by a time after `until_milis` are left out, so
+    they are never read.
+    """
+    names_by_file: dict[str, list[str]] = {}
+    for entry_name in entry_names:
+        if entry_name == METADATA_NAME:
+            continue
+        file, kind, name = entry_name.rsplit("/", 2)
+        if (
+            until_milis is not None
+            and kind == EDITS_NAME
+            and name != EDITS_PACKED_NAME
+            and until_milis < int(name)
+        ):
+            continue
+        names_by_file.setdefault(file, []).append(entry_name)
+    return names_by_file
 
 
-def load_workspace_history(changes_zip_loc: Path) -> WorkspaceChangeHistory:
+def _read_file_documents(
+    zip_contents: Mapping[str, bytes], names_by_file: dict[str, list[str]]
+) -> Iterator[tuple[str, FileDocuments]]:
+    for file_path, entry_names in names_by_file.items():
+        documents: dict[str, FileDocuments] = {}
+        for entry_name in entry_names:
+            add_history_entry(documents, entry_name, zip_contents[entry_name])
+        yield file_path, documents[file_path]
+
+
+def load_workspace_history_from_zip_contents(
+    zip_contents: Mapping[str, bytes],
+    executor: Optional[Executor] = None,
+    until: Optional[datetime] = None,
+    parallel: bool = False,
+    lazy: bool = False,
+) -> WorkspaceChangeHistory:
+    """
+    `zip_contents` maps archive names to contents, e.g. a dict from
+    `load_zipfile_contents_from_path` or an open ZipStore.
+    The entries of one file are looked up only when that file is built, so
+    with a ZipStore at most one file's entries are held in memory at a time,
+    unless `parallel` or `lazy` is passed.
+    """
+    until_milis = None if until is None else datetime_to_milis(until)
+    metadata = get_metadata(zip_contents)
+    names_by_file = group_history_entry_names(zip_contents.keys(), until_milis)
+    file_histories = _load_file_histories(
+        _read_file_documents(zip_contents, names_by_file),
+        executor,
+        until,
+        parallel,
+        lazy,
+    )
+    return _workspace_history(metadata, file_histories)
+
+
+def load_workspace_history(
+    changes_zip_loc: Path,
+    executor: Optional[Executor] = None,
+    until: Optional[datetime] = None,
+    parallel: bool = False,
+    lazy: bool = False,
+    read_workers: Optional[int] = None,
+) -> WorkspaceChangeHistory:
     """
-    Load e.g. changes.zip into a workspace history mapping
+    Load e.g. changes.zip into a workspace history mapping.
+    Pass an executor to share one pool for decoding across all files.
+    Pass `until` to skip decoding edits made after that time.
+    Pass `parallel` to load the files in worker processes instead.
+    Pass `lazy` to only decode the files whose history is actually used.
+    The executor is not used for lazily decoded files.
+    Pass `read_workers` to read the archive with that many threads.
     """
-    zip_contents = load_zipfile_contents_from_path(changes_zip_loc)
-    return load_workspace_history_from_zip_contents(zip_contents)
+    if not changes_zip_loc.exists():
+        raise FileNotFoundError(f"Zip file path {changes_zip_loc} does not exist")
+    if read_workers is not None:
+        return load_workspace_history_from_entries(
+            iter_zip_entries_threaded(changes_zip_loc, read_workers),
+            executor,
+            until,
+            parallel,
+            lazy,
+        )
+    with open_zip(changes_zip_loc) as zipped_file:
+        return load_workspace_history_from_entries(
+            iter_zip_entries(zipped_file), executor, until, parallel, lazy
+        )
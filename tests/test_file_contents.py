@@ -0,0 +1,100 @@
+"""
+Replaying edits through a buffer must agree with applying them to a str.
+"""
+
+from datetime import datetime
+
+import pytest
+
+from edit_data.types import *
+from edit_data.edits import (
+    apply_change,
+    apply_edit,
+    changes_are_descending,
+    get_file_contents,
+)
+
+
+def make_multi_edit(
+    base_change: NewConcreteCheckpoint, changes: list[tuple[int, int, str]]
+) -> Edit:
+    return Edit(
+        file="file.txt",
+        time=base_change.mtime,
+        base_change=base_change,
+        changes=[
+            ContentChange(
+                range=get_range(0, 0, 0, 0),
+                text=text,
+                rangeOffset=offset,
+                rangeLength=length,
+            )
+            for offset, length, text in changes
+        ],
+    )
+
+
+def make_edit(
+    base_change: NewConcreteCheckpoint, offset: int, length: int, text: str
+) -> Edit:
+    return make_multi_edit(base_change, [(offset, length, text)])
+
+
+def test_get_file_contents_matches_slicing():
+    base = "hello world"
+    checkpoint = NewConcreteCheckpoint(contents=base, mtime=datetime(2024, 1, 1))
+    edits = [
+        make_edit(checkpoint, 5, 0, ","),
+        make_edit(checkpoint, 0, 1, "H"),
+        make_edit(checkpoint, 7, 5, "wörld"),  # first non-ASCII text
+        make_edit(checkpoint, 12, 0, " 👋"),
+        make_edit(checkpoint, 1, 4, "i"),
+        make_edit(checkpoint, 100, 3, "!"),  # past the end
+    ]
+
+    expected = base
+    for edit in edits:
+        expected = apply_change(expected, edit.changes[0])
+    assert get_file_contents(base, edits) == expected == "Hi, wörld 👋!"
+
+
+def test_get_file_contents_non_ascii_base():
+    checkpoint = NewConcreteCheckpoint(contents="größe", mtime=datetime(2024, 1, 1))
+    edits = [make_edit(checkpoint, 3, 1, "ss"), make_edit(checkpoint, 0, 0, "die ")]
+    assert get_file_contents(checkpoint.contents, edits) == "die grösse"
+
+
+def test_get_file_contents_lone_surrogates():
+    checkpoint = NewConcreteCheckpoint(contents="a\udc00b", mtime=datetime(2024, 1, 1))
+    edits = [make_edit(checkpoint, 3, 0, "\ud83d"), make_edit(checkpoint, 0, 1, "x")]
+    expected = checkpoint.contents
+    for edit in edits:
+        expected = apply_change(expected, edit.changes[0])
+    assert get_file_contents(checkpoint.contents, edits) == expected == "x\udc00b\ud83d"
+    # A surrogate can also arrive while the buffer is still ASCII.
+    assert get_file_contents("ab", edits[:1]) == "ab\ud83d"
+
+
+@pytest.mark.parametrize(
+    "changes, descending",
+    [
+        pytest.param([(6, 5, "there"), (0, 5, "hi")], True, id="descending"),
+        pytest.param([(3, 0, "X"), (3, 0, "Y")], True, id="same_offset_inserts"),
+        pytest.param([(20, 0, "!"), (0, 0, "A")], False, id="past_the_end"),
+        pytest.param([(0, 0, "A"), (5, 0, "B")], False, id="ascending"),
+    ],
+)
+def test_apply_edit_matches_sequential_changes(
+    changes: list[tuple[int, int, str]], descending: bool
+):
+    checkpoint = NewConcreteCheckpoint(
+        contents="hello world", mtime=datetime(2024, 1, 1)
+    )
+    edit = make_multi_edit(checkpoint, changes)
+    assert changes_are_descending(checkpoint.contents, edit.changes) == descending
+
+    expected = checkpoint.contents
+    for change in edit.changes:
+        expected = apply_change(expected, change)
+    assert apply_edit(checkpoint.contents, edit) == expected
+    assert get_file_contents(checkpoint.contents, [edit]) == expected
@@ -4,8 +4,11 @@ from pathlib import Path
 
 
 from edit_data.types import *
+from edit_data import edits
 from edit_data.edits import (
+    get_snapshots,
     get_version_at_edit,
+    iter_versions,
 )
 from edit_data.fake_it import get_linear_workspace_history
 
@@ -20,10 +23,10 @@ def check_all_prefixes(
     """
     For a linear file history, every prefix of a string should be reproduced
     by the file history.
-
-    TODO: Maybe `get_version_at_edit` could be faster
     """
-    for i in range(len(file_contents)):
+    versions = iter_versions(workspace_history[file_relpath])
+    for i, version in zip(range(len(file_contents)), versions, strict=True):
+        assert version == file_contents[: i + 1]
         workspace_version = get_version_at_edit(file_relpath, workspace_history, i)
         file_version = workspace_version[file_relpath]
         assert file_version == file_contents[: i + 1]
@@ -57,5 +60,35 @@ def test_get_linear_workspace_history():
     check_all_prefixes(workspace_history_dict, file2_relpath, file2_contents)
 
 
+def test_snapshots_are_bounded(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(edits, "SNAPSHOT_STRIDE", 1)
+    monkeypatch.setattr(edits, "MAX_SNAPSHOTS", 3)
+    workspace_history_dict = get_linear_workspace_history(TEST_PROJECT_1).get_dict()
+    file1_relpath = Path("file1.txt")
+    file1_history = workspace_history_dict[file1_relpath]
+    file1_contents = (TEST_PROJECT_1 / file1_relpath).read_text()
+    assert 3 < len(file1_contents)
+
+    # Query every file after every edit, which fills every cache.
+    check_all_prefixes(workspace_history_dict, file1_relpath, file1_contents)
+    assert len(get_snapshots(file1_history)) <= 3
+    retained = 0
+    allowed = 0
+    for file_history in workspace_history_dict.values():
+        retained += sum(len(v) for v in file_history.version_cache.values())
+        retained += sum(
+            len(snapshot)
+            for snapshots in file_history.snapshot_cache.values()
+            for snapshot in snapshots
+        )
+        largest = max(map(len, iter_versions(file_history)), default=0)
+        allowed += (edits.MAX_SNAPSHOTS + edits.VERSION_CACHE_SIZE) * largest
+    assert 0 < retained <= allowed
+
+    file1_history.clear_caches()
+    assert file1_history.version_cache == {}
+    assert file1_history.snapshot_cache == {}
+    check_all_prefixes(workspace_history_dict, file1_relpath, file1_contents)
+
 if __name__ == "__main__":
     cProfile.run("test_get_linear_workspace_history()")
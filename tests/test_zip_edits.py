@@ -1,9 +1,26 @@
+import io
+import operator
 import tempfile
+import zipfile
 import logging
+from typing import Any
 from pathlib import Path
+from datetime import datetime, timedelta
 
-from edit_data.fake_it import get_linear_workspace_history
-from edit_data.zip_edits import load_workspace_history
+import pytest
+
+from edit_data.types import *
+from edit_data.edits import get_version_at_time
+from edit_data.fake_it import get_linear_workspace_history, get_local_state
+from edit_data import zip_edits
+from edit_data.zip_edits import (
+    FileDocuments,
+    LazyFileChangeHistory,
+    ZipStore,
+    load_workspace_history,
+    load_workspace_history_from_zip_contents,
+    open_zip,
+)
 
 from tests.common import TEST_PROJECT_1
 
@@ -27,6 +44,257 @@ def test_edit_serialization():
         assert linear_history == reloaded_history
 
 
+ROUND_TRIP_WRITE_OPTIONS = ("packed", "delta", "compression")
+ROUND_TRIP_LOAD_OPTIONS = ("read_workers", "parallel", "lazy")
+
+
+@pytest.mark.parametrize(
+    "options",
+    [
+        pytest.param({"packed": True}, id="packed"),
+        pytest.param({"delta": True}, id="delta"),
+        pytest.param({"compression": zipfile.ZIP_DEFLATED}, id="deflated"),
+        pytest.param(
+            {"compression": zipfile.ZIP_DEFLATED, "read_workers": 4},
+            id="threaded_read",
+        ),
+        pytest.param({"parallel": True}, id="parallel"),
+        pytest.param({"lazy": True}, id="lazy"),
+        pytest.param({"until": True}, id="until"),
+        pytest.param({"packed": True, "lazy": True, "until": True}, id="packed_lazy"),
+        pytest.param({"zip_store": True}, id="zip_store"),
+        pytest.param({"zip_store": True, "until": True}, id="zip_store_until"),
+        pytest.param({"in_memory": False}, id="from_disk"),
+    ],
+)
+def test_round_trip(options: dict[str, Any], monkeypatch: pytest.MonkeyPatch):
+    linear_history = get_linear_workspace_history(TEST_PROJECT_1)
+    until = None
+    if options.get("until"):
+        until = linear_history.files[0].edits_history[10].time
+    in_memory = options.get("in_memory", True)
+    if not in_memory:
+        monkeypatch.setattr(zip_edits, "IN_MEMORY_ZIP_LIMIT", 0)
+    write_options = {k: options[k] for k in ROUND_TRIP_WRITE_OPTIONS if k in options}
+    load_options = {k: options[k] for k in ROUND_TRIP_LOAD_OPTIONS if k in options}
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        tmp_zip = Path(tmpdir) / "changes.zip"
+        linear_history.write_ts_workspace_history(tmp_zip, **write_options)
+        with zipfile.ZipFile(tmp_zip) as zipped_file:
+            infos = zipped_file.infolist()
+        with open_zip(tmp_zip) as zipped_file:
+            assert isinstance(zipped_file.fp, io.BytesIO) == in_memory
+
+        if options.get("zip_store"):
+            with ZipStore(tmp_zip) as store:
+                reloaded_history = load_workspace_history_from_zip_contents(
+                    store, until=until, **load_options
+                )
+        else:
+            reloaded_history = load_workspace_history(
+                tmp_zip, until=until, **load_options
+            )
+
+    names = [Path(info.filename).name for info in infos]
+    if options.get("packed"):
+        assert EDITS_PACKED_NAME in names and CONCRETE_PACKED_NAME in names
+        assert not any(name.isdigit() for name in names)
+    compression = options.get("compression", zipfile.ZIP_STORED)
+    assert all(info.compress_type == compression for info in infos)
+    if options.get("lazy"):
+        for file_history in reloaded_history.files:
+            assert isinstance(file_history, LazyFileChangeHistory)
+            assert "edits_history" not in vars(file_history)
+
+    expected_history = linear_history
+    if until is not None:
+        expected_history = WorkspaceChangeHistory(
+            metadata=linear_history.metadata,
+            files=[
+                FileChangeHistory(
+                    f.path,
+                    [e for e in f.edits_history if e.time <= until],
+                    f.last_checkpoint,
+                )
+                for f in linear_history.files
+            ],
+        )
+        file_path = linear_history.files[0].path
+        assert get_version_at_time(
+            file_path, reloaded_history.get_dict(), until
+        ) == get_version_at_time(file_path, linear_history.get_dict(), until)
+    assert reloaded_history == expected_history
+    if options.get("lazy"):
+        for file_history in reloaded_history.files:
+            assert isinstance(file_history, LazyFileChangeHistory)
+            assert file_history.documents == FileDocuments([], [])
+
+
+def test_zip_store_reads_on_demand(monkeypatch: pytest.MonkeyPatch):
+    linear_history = get_linear_workspace_history(TEST_PROJECT_1)
+    assert 1 < len(linear_history.files)
+    reads: list[str] = []
+    reads_before_build: list[int] = []
+
+    class RecordingZipStore(ZipStore):
+        def __getitem__(self, name: str) -> bytes:
+            reads.append(name)
+            return super().__getitem__(name)
+
+    load_file_history = zip_edits.load_file_history
+
+    def recording_load_file_history(*args: Any, **kwargs: Any) -> FileChangeHistory:
+        reads_before_build.append(len(reads))
+        return load_file_history(*args, **kwargs)
+
+    monkeypatch.setattr(zip_edits, "load_file_history", recording_load_file_history)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        tmp_zip = Path(tmpdir) / "changes.zip"
+        linear_history.write_ts_workspace_history(tmp_zip)
+        with RecordingZipStore(tmp_zip) as store:
+            reloaded_history = load_workspace_history_from_zip_contents(store)
+            num_entries = len(store)
+
+    assert reloaded_history == linear_history
+    # Every entry is read exactly once, and each file is built before the
+    # entries of the files after it are read.
+    assert len(set(reads)) == len(reads) == num_entries
+    assert len(reads_before_build) == len(linear_history.files)
+    assert all(map(operator.lt, reads_before_build, reads_before_build[1:]))
+    assert reads_before_build[0] < len(reads)
+
+
+START = datetime(2024, 1, 1, 0, 0, 0)
+
+
+def make_history(
+    edits: list[tuple[datetime, ConcreteCheckpoint]], text: str = "c"
+) -> WorkspaceChangeHistory:
+    """
+    A workspace with the single file "file.txt". Each (time, checkpoint)
+    is an edit inserting `text` at the start of the file; the base of the
+    last edit is the file's last checkpoint.
+    """
+    origin = Position(line=0, character=0)
+    change = ContentChange(
+        range=Range(start=origin, end=origin), text=text, rangeOffset=0, rangeLength=0
+    )
+    file_history = FileChangeHistory(
+        path=Path("file.txt"),
+        edits_history=[
+            Edit(file="file.txt", time=time, base_change=checkpoint, changes=[change])
+            for time, checkpoint in edits
+        ],
+        last_checkpoint=edits[-1][1],
+    )
+    return WorkspaceChangeHistory(metadata=get_local_state(), files=[file_history])
+
+
+def round_trip(
+    history: WorkspaceChangeHistory, **write_options: Any
+) -> WorkspaceChangeHistory:
+    with tempfile.TemporaryDirectory() as tmpdir:
+        tmp_zip = Path(tmpdir) / "changes.zip"
+        history.write_ts_workspace_history(tmp_zip, **write_options)
+        return load_workspace_history(tmp_zip)
+
+
+def test_same_checkpoint_serialization():
+    new_checkpoint = NewConcreteCheckpoint(contents="ab", mtime=START)
+    same_checkpoint = SameConcreteCheckpoint(
+        prev=new_checkpoint, mtime=START + timedelta(seconds=1)
+    )
+    history = make_history(
+        [
+            (START + timedelta(milliseconds=500), new_checkpoint),
+            (START + timedelta(seconds=2), same_checkpoint),
+        ]
+    )
+
+    reloaded_history = round_trip(history)
+    assert history == reloaded_history
+    reloaded_dict = reloaded_history.get_dict()
+    assert get_version_at_time(Path("file.txt"), reloaded_dict, START) == "ab"
+    assert (
+        get_version_at_time(
+            Path("file.txt"), reloaded_dict, START + timedelta(seconds=3)
+        )
+        == "cab"
+    )
+
+
+def test_same_checkpoint_equality():
+    new_checkpoint = NewConcreteCheckpoint(contents="ab", mtime=START)
+    resolved, unresolved = (
+        SameConcreteCheckpoint(
+            prev=SameConcreteCheckpoint(prev=new_checkpoint, mtime=START),
+            mtime=START + timedelta(seconds=1),
+        )
+        for _ in range(2)
+    )
+    assert resolved.base_new is new_checkpoint
+    assert resolved == unresolved
+    assert unresolved.base_new is new_checkpoint
+
+
+def test_packed_line_separators():
+    # Only "\n" separates JSON Lines; the rest may appear inside strings.
+    checkpoint = NewConcreteCheckpoint(
+        contents="a\u2028b\x85c\x0cd\x1ce\r\nf", mtime=START
+    )
+    history = make_history(
+        [(START + timedelta(milliseconds=500), checkpoint)], text="\u2029\x85"
+    )
+    assert round_trip(history, packed=True) == history
+
+
+def test_lone_surrogate_escapes():
+    # JSON.stringify writes a lone surrogate as an escape pydantic-core rejects.
+    checkpoint = NewConcreteCheckpoint(contents="ab", mtime=START)
+    history = make_history([(START + timedelta(milliseconds=500), checkpoint)])
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        tmp_zip = Path(tmpdir) / "changes.zip"
+        surrogate_zip = Path(tmpdir) / "surrogate_changes.zip"
+        history.write_ts_workspace_history(tmp_zip)
+        with zipfile.ZipFile(tmp_zip) as src:
+            with zipfile.ZipFile(surrogate_zip, "w") as dst:
+                for info in src.infolist():
+                    contents = src.read(info)
+                    contents = contents.replace(b'"ab"', b'"a\\udc00b"')
+                    contents = contents.replace(b'"c"', b'"\\ud83d"')
+                    dst.writestr(info, contents)
+        reloaded_history = load_workspace_history(surrogate_zip)
+
+    reloaded_file_history = reloaded_history.files[0]
+    assert reloaded_file_history.last_checkpoint == NewConcreteCheckpoint(
+        contents="a\udc00b", mtime=START
+    )
+    assert reloaded_file_history.edits_history[0].changes[0].text == "\ud83d"
+
+
+def test_delta_checkpoint_serialization():
+    first_contents = "".join(f"line {i}\n" for i in range(1000))
+    second_contents = first_contents.replace("line 500\n", "changed\n")
+    checkpoints = [
+        NewConcreteCheckpoint(contents=first_contents, mtime=START),
+        NewConcreteCheckpoint(
+            contents=second_contents, mtime=START + timedelta(seconds=1)
+        ),
+    ]
+    history = make_history(
+        [
+            (checkpoint.mtime + timedelta(milliseconds=500), checkpoint)
+            for checkpoint in checkpoints
+        ]
+    )
+
+    file_entries = history.files[0].ts_entries(delta=True)
+    assert sum(len(contents) for _, contents in file_entries) < 2 * len(first_contents)
+    assert round_trip(history, delta=True) == history
+
+
 if __name__ == "__main__":
     logging.basicConfig(level=logging.INFO)
     test_edit_serialization()